@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+
+"""Rendering microbenchmarks.
+
+   Hot rendering paths are run against an in-memory recording port, so no
+   hardware is required. Results may be saved as a JSON baseline, and later
+   runs fail whenever a timing regresses beyond a threshold, or the count
+   of bytes sent on the wire increases.
+
+   As timings are machine specific, the committed baseline only holds byte
+   counts, which are deterministic, so that timings are NOT checked by
+   default. To also check timings, first save a local baseline with -T.
+
+   bench.py [-u [-T]] [-b baseline.json] [-t threshold] [-k filter]
+"""
+
+from argparse import ArgumentParser
+from glob import glob
+from json import dump as jdump, load as jload
+from os.path import basename, dirname, isfile, join as joinpath
+from sys import exit, path as syspath
+from time import perf_counter
+
+TOPDIR = dirname(__file__)
+syspath[:0] = [joinpath(TOPDIR, 'oled'), joinpath(TOPDIR, 'eink')]
+
+from bitmapfont import BitmapFont  # noqa: E402
+from epd2in9 import EPD  # noqa: E402
+from oled import GfxBuffer, Ssd1306  # noqa: E402
+
+DEFAULT_THRESHOLD = 0.2
+SHORT_TEXT = 'Hi!'
+LONG_TEXT = 'The quick brown fox jumps over the lazy dog'
+
+
+class RecordingPort:
+    """In-memory port, which only accounts for the emitted traffic"""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.bytes = 0
+        self.transfers = 0
+
+    def _record(self, data):
+        self.bytes += isinstance(data, int) and 1 or len(data)
+        self.transfers += 1
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def reset(self):
+        pass
+
+    def wait_ready(self):
+        return 0
+
+    def write_command(self, data):
+        self._record(data)
+
+    def write_data(self, data):
+        self._record(data)
+
+
+class Benchmark:
+    """Collection of named benchmark cases"""
+
+    def __init__(self, pattern=None):
+        self._pattern = pattern
+        self.cases = {}
+        self.skipped = []
+
+    def add(self, name, func, port=None):
+        if self._pattern and self._pattern not in name:
+            return
+        self.cases[name] = (func, port)
+
+    def run(self, min_time=0.05, repeat=5):
+        results = {}
+        for name, (func, port) in sorted(self.cases.items()):
+            # count the steady state traffic, without one-off commands such
+            # as a data entry mode change, whatever the selected cases
+            func()
+            if port:
+                port.clear()
+                func()
+            traffic = port.bytes if port else None
+            loops = 1
+            while True:
+                elapsed = self._time(func, loops)
+                if elapsed >= min_time:
+                    break
+                loops *= 2
+            best = min([elapsed] + [self._time(func, loops)
+                                    for _ in range(repeat-1)])
+            results[name] = {'time': best/loops, 'bytes': traffic}
+            print('%-40s %10.1f us %8s bytes' %
+                  (name, 1E6*best/loops, '-' if traffic is None else traffic))
+        return results
+
+    @staticmethod
+    def _time(func, loops):
+        start = perf_counter()
+        for _ in range(loops):
+            func()
+        return perf_counter() - start
+
+
+def font_cases(bench):
+    for font_path in sorted(glob(joinpath(TOPDIR, 'oled', 'fonts', '*.bin'))):
+        font_name = basename(font_path)
+        gfxbuf = GfxBuffer(None, Ssd1306.WIDTH, Ssd1306.HEIGHT)
+        bf = BitmapFont(gfxbuf, font_name)
+        bf.init()
+        for label, text in (('short', SHORT_TEXT), ('long', LONG_TEXT)):
+            for y in (8, 13):
+                bench.add('text[%s-%s-y%d]' % (font_name[:-4], label, y),
+                          lambda bf=bf, text=text, y=y: bf.text(text, 3, y))
+        bench.add('text[%s-bold]' % font_name[:-4],
+                  lambda bf=bf: bf.text(SHORT_TEXT, 3, 13, bold=True))
+        # text path down to the wire, including the dirty area paint
+        port = RecordingPort()
+        disp = Ssd1306(port)
+        for label, text in (('short', SHORT_TEXT), ('long', LONG_TEXT)):
+            bench.add('text_paint[%s-%s]' % (font_name[:-4], label),
+                      lambda disp=disp, font=font_name, text=text:
+                      disp.text(text, 3, 13, font), port)
+    gfxbuf = GfxBuffer(None, Ssd1306.WIDTH, Ssd1306.HEIGHT)
+    bf = BitmapFont(gfxbuf)
+    for name, area in (('full', (0, 0, Ssd1306.WIDTH, Ssd1306.HEIGHT)),
+                       ('aligned', (10, 16, 40, 16)),
+                       ('unaligned', (10, 13, 40, 21))):
+        bench.add('erase[%s]' % name, lambda area=area: bf.erase(*area))
+
+
+def gfx_cases(bench):
+    port = RecordingPort()
+    disp = Ssd1306(port)
+    gfxbuf = disp.gfxbuf
+
+    def paint(tl=None, br=None):
+        gfxbuf.invalidate(tl, br)
+        gfxbuf.paint()
+
+    bench.add('paint[full]', paint, port)
+    bench.add('paint[small]', lambda: paint((40, 16), (72, 32)), port)
+    try:
+        from PIL import Image
+    except ImportError:
+        bench.skipped.append('copy_bitmap: PIL is not available')
+        return
+    full = Image.new('1', (Ssd1306.WIDTH, Ssd1306.HEIGHT), 1)
+    small = Image.new('1', (16, 16), 1)
+    bench.add('copy_bitmap[full]', lambda: gfxbuf.copy_bitmap(full))
+    bench.add('copy_bitmap[small]', lambda: gfxbuf.copy_bitmap(small, 40, 13))
+
+
+def epd_cases(bench):
+    try:
+        from PIL import Image
+    except ImportError:
+        bench.skipped.append('set_frame_memory: PIL is not available')
+        return
+    port = RecordingPort()
+    epd = EPD(port)
+    full = Image.new('1', (epd.width, epd.height), 0xff)
+    small = Image.new('1', (24, 32), 0xff)
+    bench.add('set_frame_memory[full]',
+              lambda: epd.set_frame_memory(full, 0, 0), port)
+    bench.add('set_frame_memory[small]',
+              lambda: epd.set_frame_memory(small, 40, 20), port)
+
+
+def compare(results, baseline, threshold):
+    """Report regressions against a baseline.
+
+       :return: the count of regressions
+    """
+    failures = 0
+    for name, result in sorted(results.items()):
+        ref = baseline.get(name)
+        if not ref:
+            continue
+        if 'time' in ref and result['time'] > ref['time'] * (1 + threshold):
+            print('%s: time regression %.1f us -> %.1f us' %
+                  (name, 1E6*ref['time'], 1E6*result['time']))
+            failures += 1
+        if ref.get('bytes') is not None and result['bytes'] > ref['bytes']:
+            print('%s: traffic regression %d -> %d bytes' %
+                  (name, ref['bytes'], result['bytes']))
+            failures += 1
+    return failures
+
+
+def main():
+    argparser = ArgumentParser(description=__doc__.split('\n')[0])
+    argparser.add_argument('-b', '--baseline',
+                           default=joinpath(TOPDIR, 'bench.json'),
+                           help='baseline file')
+    argparser.add_argument('-u', '--update', action='store_true',
+                           help='save results as the new baseline')
+    argparser.add_argument('-T', '--timings', action='store_true',
+                           help='also save the machine specific timings')
+    argparser.add_argument('-t', '--threshold', type=float,
+                           help='allowed time regression ratio, default to '
+                                '%.1f' % DEFAULT_THRESHOLD)
+    argparser.add_argument('-k', '--filter',
+                           help='only run cases whose name contains filter')
+    args = argparser.parse_args()
+    bench = Benchmark(args.filter)
+    font_cases(bench)
+    gfx_cases(bench)
+    epd_cases(bench)
+    results = bench.run()
+    for reason in bench.skipped:
+        print('Skipped %s' % reason)
+    if args.update:
+        baseline = {}
+        if isfile(args.baseline):
+            with open(args.baseline, 'rt') as jfp:
+                baseline = jload(jfp)
+        for name, result in results.items():
+            if not args.timings:
+                if result['bytes'] is None:
+                    continue
+                result = {'bytes': result['bytes']}
+            baseline[name] = result
+        with open(args.baseline, 'wt') as jfp:
+            jdump(baseline, jfp, indent=2, sort_keys=True)
+        return
+    if not isfile(args.baseline):
+        print('No baseline, use -u to create one')
+        return
+    with open(args.baseline, 'rt') as jfp:
+        baseline = jload(jfp)
+    if args.threshold is not None and \
+       not any('time' in ref for ref in baseline.values()):
+        argparser.error('No timing baseline in %s, use -u -T to create one' %
+                        args.baseline)
+    threshold = DEFAULT_THRESHOLD if args.threshold is None \
+        else args.threshold
+    if compare(results, baseline, threshold):
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
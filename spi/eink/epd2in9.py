@@ -1,7 +1,12 @@
 from array import array
-from ftdi_spi import get_port
 from time import sleep
 
+# Map any non-zero pixel value to 1
+NONZERO = bytes([0] + [1] * 255)
+# Reverse the bit order of a byte
+REVERSE_BITS = bytes([int('{0:08b}'.format(value)[::-1], 2)
+                      for value in range(256)])
+
 
 class EPD:
 
@@ -32,6 +37,19 @@ class EPD:
     SET_RAM_Y_ADDRESS_COUNTER = 0x4F
     TERMINATE_FRAME_READ_WRITE = 0xFF
 
+    # Data entry modes
+    ENTRY_X_INCREMENT = 1 << 0
+    ENTRY_Y_INCREMENT = 1 << 1
+    ENTRY_Y_FIRST = 1 << 2  # update the Y address counter first
+
+    # Data entry mode for each orientation, in degrees clockwise
+    ORIENTATIONS = {
+        0: ENTRY_X_INCREMENT | ENTRY_Y_INCREMENT,
+        90: ENTRY_Y_FIRST | ENTRY_Y_INCREMENT,
+        180: 0,
+        270: ENTRY_Y_FIRST | ENTRY_X_INCREMENT,
+    }
+
     LUT_FULL_UPDATE = (
         0x02, 0x02, 0x01, 0x11, 0x12, 0x12, 0x22, 0x22, 0x66, 0x69, 0x69, 0x59,
         0x58, 0x99, 0x99, 0x88, 0x00, 0x00, 0x00, 0x00, 0xF8, 0xB4, 0x13, 0x51,
@@ -44,11 +62,21 @@ class EPD:
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00
     )
 
-    def __init__(self):
+    def __init__(self, port=None, orientation=0):
+        if orientation not in self.ORIENTATIONS:
+            raise ValueError('Unsupported orientation: %s' % orientation)
         self.width = self.EPD_WIDTH
         self.height = self.EPD_HEIGHT
+        self.orientation = orientation
+        self._entry_mode = None
         self.lut = self.LUT_FULL_UPDATE
-        self.port = get_port()
+        if not port:
+            from ftdi_spi import get_port
+            port = get_port()
+        self.port = port
+        # last known content of the two RAM banks, None if unknown
+        self._banks = [None, None]
+        self._bank = 0
 
     def delay_ms(self, delaytime):
         sleep(delaytime / 1000.0)
@@ -66,6 +94,8 @@ class EPD:
         # EPD hardware init start
         self.lut = lut
         self.reset()
+        self._banks = [None, None]
+        self._bank = 0
         self.send_command(self.DRIVER_OUTPUT_CONTROL)
         self.send_data((self.EPD_HEIGHT - 1) & 0xFF)
         self.send_data(((self.EPD_HEIGHT - 1) >> 8) & 0xFF)
@@ -80,8 +110,8 @@ class EPD:
         self.send_data(0x1A)                     # 4 dummy lines per gate
         self.send_command(self.SET_GATE_TIME)
         self.send_data(0x08)                     # 2us per line
-        self.send_command(self.DATA_ENTRY_MODE_SETTING)
-        self.send_data(0x03)                     # X increment Y increment
+        self._entry_mode = None
+        self.set_data_entry_mode(self.ORIENTATIONS[0])
         self.set_lut(self.lut)
         # EPD hardware init end
 
@@ -94,6 +124,14 @@ class EPD:
     def reset(self):
         self.port.reset()
 
+    def set_data_entry_mode(self, mode):
+        """select the address counter update order and directions"""
+        if mode == self._entry_mode:
+            return
+        self.send_command(self.DATA_ENTRY_MODE_SETTING)
+        self.send_data(mode)
+        self._entry_mode = mode
+
     def set_lut(self, lut):
         """set the look-up table register"""
         self.lut = lut
@@ -103,8 +141,9 @@ class EPD:
             self.send_data(self.lut[i])
 
     def get_frame_buffer(self, image):
-        """convert an image to a buffer"""
-        buf = [0x00] * (self.width * self.height / 8)
+        """convert a portrait image to a buffer in the native layout,
+           whatever the display orientation
+        """
         # Set buffer to value of Python Imaging Library image.
         # Image must be in mode 1.
         image_monocolor = image.convert('1')
@@ -112,64 +151,213 @@ class EPD:
         if imwidth != self.width or imheight != self.height:
             raise ValueError('Image must be same dimensions as display \
                 ({0}x{1}).' .format(self.width, self.height))
+        # mode 1 images are packed MSB first, one byte per 8 pixels
+        return image_monocolor.tobytes()
+
+    def update_frame(self, frame):
+        """write a full frame buffer to the frame memory, only sending the
+           smallest byte-aligned window which differs from the last known
+           content of the RAM bank being updated.
+           full frames are in the native portrait layout, whatever the
+           display orientation: use set_frame_memory to write images in
+           the display orientation.
+           this won't update the display.
+
+           :param frame: frame buffer, as built by get_frame_buffer
+           :return: the updated (x, y, x_end, y_end) window, or None
+        """
+        frame = bytes(frame)
+        if len(frame) != self.width // 8 * self.height:
+            raise ValueError('Invalid frame buffer size')
+        window = self._get_dirty_window(self._banks[self._bank], frame)
+        if window:
+            x, y, x_end, y_end = window
+            stride = self.width // 8
+            buf = bytearray()
+            for row in range(y, y_end + 1):
+                pos = row * stride
+                buf.extend(frame[pos + (x >> 3):pos + (x_end >> 3) + 1])
+            self._write_window(self.ORIENTATIONS[0], x, y, x_end, y_end,
+                               buf)
+        self._banks[self._bank] = frame
+        return window
+
+    def _get_dirty_window(self, previous, frame):
+        stride = self.width // 8
+        if previous is None:
+            return 0, 0, self.width - 1, self.height - 1
+        first_row = last_row = None
+        first_col = stride
+        last_col = -1
+        for row in range(self.height):
+            pos = row * stride
+            old = previous[pos:pos + stride]
+            new = frame[pos:pos + stride]
+            if old == new:
+                continue
+            if first_row is None:
+                first_row = row
+            last_row = row
+            diff = int.from_bytes(old, 'big') ^ int.from_bytes(new, 'big')
+            # the first differing byte holds the most significant bit
+            first_col = min(first_col,
+                            stride - 1 - (diff.bit_length() - 1) // 8)
+            lowest = (diff & -diff).bit_length() - 1
+            last_col = max(last_col, stride - 1 - lowest // 8)
+        if first_row is None:
+            return None
+        return first_col * 8, first_row, last_col * 8 + 7, last_row
+
+    def _patch_bank(self, x, y, x_end, y_end, data, mode):
+        frame = self._banks[self._bank]
+        if frame is None:
+            return
+        frame = bytearray(frame)
+        stride = self.width // 8
+        first, last = x >> 3, x_end >> 3
+        width = last - first + 1
+        height = y_end - y + 1
+        if mode & self.ENTRY_Y_FIRST:
+            # data is made of columns of bytes
+            for col in range(width):
+                pos = col * height
+                column = data[pos:pos + height]
+                if not mode & self.ENTRY_Y_INCREMENT:
+                    column = column[::-1]
+                xpos = first + col if mode & self.ENTRY_X_INCREMENT \
+                    else last - col
+                pos = y * stride + xpos
+                frame[pos:pos + (height - 1) * stride + 1:stride] = column
+        else:
+            # data is made of rows of bytes
+            for row in range(height):
+                pos = row * width
+                line = data[pos:pos + width]
+                if not mode & self.ENTRY_X_INCREMENT:
+                    line = line[::-1]
+                ypos = y + row if mode & self.ENTRY_Y_INCREMENT \
+                    else y_end - row
+                pos = ypos * stride + first
+                frame[pos:pos + width] = line
+        self._banks[self._bank] = bytes(frame)
+
+    def _write_window(self, mode, x, y, x_end, y_end, data):
+        """write data to a RAM window, the address counters starting from
+           the window corner selected by the data entry mode
+        """
+        self.set_data_entry_mode(mode)
+        if mode & self.ENTRY_X_INCREMENT:
+            x_start, x_stop = x, x_end
+        else:
+            x_start, x_stop = x_end, x
+        if mode & self.ENTRY_Y_INCREMENT:
+            y_start, y_stop = y, y_end
+        else:
+            y_start, y_stop = y_end, y
+        self.set_memory_area(x_start, y_start, x_stop, y_stop)
+        self.set_memory_pointer(x_start, y_start)
+        self.send_command(self.WRITE_RAM)
+        self.send_data(data)
+        self._patch_bank(x, y, x_end, y_end, data, mode)
 
-        pixels = image_monocolor.load()
-        for y in range(self.height):
-            for x in range(self.width):
-                # Set the bits for the column of pixels at the current
-                # position.
-                if pixels[x, y] != 0:
-                    buf[(x + y * self.width) / 8] |= 0x80 >> (x % 8)
-        return buf
+    @staticmethod
+    def _pack_bands(image, msb_on_top):
+        """pack bands of 8 rows of pixels into bytes, one per column"""
+        width, height = image.size
+        pixels = image.convert('L').tobytes().translate(NONZERO)
+        buf = bytearray()
+        for band in range(0, height, 8):
+            value = 0
+            for row in range(8):
+                pos = (band + row) * width
+                # as each byte is 0 or 1, shifting never carries over
+                shift = 7 - row if msb_on_top else row
+                value |= int.from_bytes(pixels[pos:pos + width],
+                                        'little') << shift
+            buf.extend(value.to_bytes(width, 'little'))
+        return bytes(buf)
 
     def set_frame_memory(self, image, x, y):
         """put an image to the frame memory.
+           the image and its location are expressed in the display
+           orientation, which is applied by the controller, so that
+           images never need to be rotated.
            this won't update the display.
         """
         if (image is None or x < 0 or y < 0):
             return
         image_monocolor = image.convert('1')
         image_width, image_height = image_monocolor.size
-        # x point must be the multiple of 8 or the last 3 bits will be ignored
-        x = x & 0xF8
-        image_width = image_width & 0xF8
-        if (x + image_width >= self.width):
-            x_end = self.width - 1
+        if self.orientation in (0, 180):
+            width, height = self.width, self.height
+            # x point must be the multiple of 8 or the last 3 bits will be
+            # ignored
+            x = x & ~7
+            image_width = image_width & ~7
+        else:
+            width, height = self.height, self.width
+            # y point must be the multiple of 8 or the last 3 bits will be
+            # ignored
+            y = y & ~7
+            image_height = image_height & ~7
+        if (x + image_width >= width):
+            x_end = width - 1
         else:
             x_end = x + image_width - 1
-        if (y + image_height >= self.height):
-            y_end = self.height - 1
+        if (y + image_height >= height):
+            y_end = height - 1
         else:
             y_end = y + image_height - 1
-        self.set_memory_area(x, y, x_end, y_end)
-        self.set_memory_pointer(x, y)
-        self.send_command(self.WRITE_RAM)
-        # send the image data
-        pixels = image_monocolor.load()
-        byte_to_send = 0x00
-        buf = array('B')
-        for j in range(0, y_end - y + 1):
-            # 1 byte = 8 pixels, steps of i = 8
-            for i in range(0, x_end - x + 1):
-                # Set the bits for the column of pixels at the current
-                # position.
-                if pixels[i, j] != 0:
-                    byte_to_send |= 0x80 >> (i % 8)
-                if (i % 8 == 7):
-                    buf.append(byte_to_send)
-                    byte_to_send = 0x00
-        self.send_data(buf)
+        if x_end < x or y_end < y:
+            # out of the frame memory, or narrower than a byte
+            return
+        image_monocolor = image_monocolor.crop((0, 0, x_end - x + 1,
+                                                y_end - y + 1))
+        if self.orientation in (0, 180):
+            # mode 1 images are packed MSB first, one byte per 8 pixels,
+            # and the window width is a multiple of 8
+            buf = image_monocolor.tobytes()
+        else:
+            # each RAM byte covers 8 rows of a column of the image
+            buf = self._pack_bands(image_monocolor, self.orientation == 270)
+        # locate the window in RAM coordinates
+        if self.orientation == 0:
+            window = (x, y, x_end, y_end)
+        elif self.orientation == 90:
+            window = (self.width - 1 - y_end, x, self.width - 1 - y, x_end)
+        elif self.orientation == 180:
+            # the bit order within a byte does not depend on the X direction
+            buf = buf.translate(REVERSE_BITS)
+            window = (self.width - 1 - x_end, self.height - 1 - y_end,
+                      self.width - 1 - x, self.height - 1 - y)
+        else:
+            window = (y, self.height - 1 - x_end, y_end, self.height - 1 - x)
+        self._write_window(self.ORIENTATIONS[self.orientation], *window, buf)
+
+    def draw_sprite(self, sprite, x, y):
+        """put a pre-compiled sprite, see sprites.py, to the frame memory.
+           the sprite and its location are expressed in the native portrait
+           orientation, whatever the display orientation.
+           this won't update the display.
+        """
+        # x point must be the multiple of 8 or the last 3 bits will be ignored
+        x = x & 0xF8
+        x_end = x + 8 * sprite.row_width - 1
+        y_end = y + sprite.height - 1
+        if x_end >= self.width or y_end >= self.height:
+            raise ValueError('Sprite does not fit in frame memory')
+        self._write_window(self.ORIENTATIONS[0], x, y, x_end, y_end,
+                           sprite.rows)
 
     def clear_frame_memory(self, color):
         """clear the frame memory with the specified color.
            this won't update the display.
         """
-        self.set_memory_area(0, 0, self.width - 1, self.height - 1)
-        self.set_memory_pointer(0, 0)
-        self.send_command(self.WRITE_RAM)
         # send the color data
-        for i in range(0, self.width // 8 * self.height):
-            self.send_data(color)
+        frame = bytes([color]) * (self.width // 8 * self.height)
+        self._write_window(self.ORIENTATIONS[0], 0, 0, self.width - 1,
+                           self.height - 1, frame)
+        self._banks[self._bank] = frame
 
     def display_frame(self):
         """update the display
@@ -183,6 +371,7 @@ class EPD:
         self.send_command(self.MASTER_ACTIVATION)
         self.send_command(self.TERMINATE_FRAME_READ_WRITE)
         self.wait_until_idle()
+        self._bank ^= 1
 
     def set_memory_area(self, x_start, y_start, x_end, y_end):
         """specify the memory area for data R/W"""
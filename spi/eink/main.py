@@ -7,21 +7,21 @@ from time import localtime, strftime, time as now
 
 
 def main(fontname):
-    epd = EPD()
+    # landscape orientation is applied by the controller
+    epd = EPD(orientation=90)
 
     # use full update to ensure proper start up
     epd.init(epd.LUT_FULL_UPDATE)
-    image = Image.new('1', (epd.width, epd.height), 0xff)
     epd.clear_frame_memory(0xFF)
-    epd.set_frame_memory(image, 0, 0)
     epd.display_frame()
     epd.fini()
 
     # use partial update to speed up refresh
+    # both RAM banks need to be written once
     epd.init(epd.LUT_PARTIAL_UPDATE)
-    epd.set_frame_memory(image, 0, 0)
+    epd.clear_frame_memory(0xFF)
     epd.display_frame()
-    epd.set_frame_memory(image, 0, 0)
+    epd.clear_frame_memory(0xFF)
     epd.display_frame()
 
     big = False
@@ -40,7 +40,7 @@ def main(fontname):
             timestr = strftime('%H:%M', localtime(ts))
         print(timestr)
         draw.text((0, 0), timestr, font=font, fill=0x00)
-        epd.set_frame_memory(time_image.rotate(-90, expand=True), 45, 20)
+        epd.set_frame_memory(time_image, 20, 64)
         epd.display_frame()
         epd.wait_until_idle()
 
@@ -2,6 +2,8 @@
 # Original author: Tony DiCola
 # License: MIT License (https://opensource.org/licenses/MIT)
 
+from bitpack import or_into, shift_glyph
+from io import BytesIO
 from os.path import dirname, join as joinpath
 
 
@@ -29,7 +31,9 @@ class BitmapFont(object):
         # Note that only fonts up to 8 pixels tall are currently supported.
         font_file = joinpath(dirname(__file__), 'fonts', self._font_name)
         print(font_file)
-        self._font = open(font_file, 'rb')
+        # fonts are small enough to be kept in memory
+        with open(font_file, 'rb') as ffp:
+            self._font = BytesIO(ffp.read())
         self._font_width, self._font_height = self._font.read(2)
         print('Font W:%d x H:%d' % (self._font_width, self._font_height))
 
@@ -53,53 +57,32 @@ class BitmapFont(object):
         # Don't draw the character if it will be clipped off the visible area.
         if x < -self._font_width or x >= self._gfxbuf.width or \
            y < -self._font_height or y >= self._gfxbuf.height:
-            return None, None
-        # Go through each column of the character.
+            return
+        width = self._gfxbuf.width
         bpc = self.byte_count_for_height(self._font_height)
-        first_pos = 0
+        # Grab all the columns of the character at once, and transpose them
+        # into display pages.
+        self._font.seek(2 + bpc*ord(ch)*self._font_width)
+        pages = shift_glyph(self._font.read(bpc*self._font_width), bpc,
+                            y & 7)
+        # Clip the columns off the visible area, the bold copy of a column
+        # being drawn on its right.
+        first_col = max(0, -x)
+        last_col = min(self._font_width, width-x)
+        last_bold_col = min(self._font_width, width-1-x)
         last_pos = len(self._gfxbuf)-1
-        for char_x in range(self._font_width):
-            # Grab the byte for the current column of font data.
-            self._font.seek(2 + bpc*(ord(ch)*self._font_width+char_x))
-            bytes_ = self._font.read(bpc)
-            bits = sum([bv << (8*bp) for bp, bv in enumerate(bytes_)])
-            pos = self._gfxbuf.width * (y >> 3)
-            yoff = y & 7
-            pos += x + char_x
-            if not first_pos:
-                first_pos = pos
-            if pos >= last_pos:
+        for page, data in enumerate(pages, start=y >> 3):
+            if page < 0:
+                continue
+            pos = width*page + x
+            if pos + first_col >= last_pos:
                 break
-            l_col = (x + char_x) >= self._gfxbuf.width
-            lbo_col = (x + char_x) >= (self._gfxbuf.width-1)
-            dbg = []
-            if yoff == 0:
-                for col in range(bpc):
-                    if not l_col:
-                        self._gfxbuf.buffer[pos] |= bits & 0xff
-                        dbg.append('{0:08b}'.format(bits & 0xff).replace('0',
-                                   ' ').replace('1', chr(0x2589)))
-                    if bold and not lbo_col:
-                        self._gfxbuf.buffer[pos+1] |= bits & 0xff
-                    bits >>= 8
-                    pos += self._gfxbuf.width
-                    if pos >= last_pos:
-                        break
-            else:
-                bits <<= yoff
-                for col in range(bpc+1):
-                    if not l_col:
-                        self._gfxbuf.buffer[pos] |= bits & 0xff
-                        dbg.append('{0:08b}'.format(bits & 0xff).replace('0',
-                                   ' ').replace('1', chr(0x2589)))
-                    if bold and not lbo_col:
-                        self._gfxbuf.buffer[pos+1] |= bits & 0xff
-                    bits >>= 8
-                    pos += self._gfxbuf.width
-                    if pos >= last_pos:
-                        break
-            # print(''.join(reversed(dbg)))
-        return first_pos, min(pos + 1 + int(bool(bold)), last_pos)
+            if first_col < last_col:
+                or_into(self._gfxbuf.buffer, pos + first_col,
+                        data[first_col:last_col])
+            if bold and first_col < last_bold_col:
+                or_into(self._gfxbuf.buffer, pos + first_col + 1,
+                        data[first_col:last_bold_col])
 
     def erase(self, x, y, w, h):
         if (x + w) > self._gfxbuf.width:
@@ -136,20 +119,14 @@ class BitmapFont(object):
     def text(self, text, x, y, bold=False):
         # Draw the specified text at the specified location.
         self._erase_text(text, x, y, bold)
-        fpos = len(self._gfxbuf)-1
-        lpos = 0
         for i in range(len(text)):
-            first, last = self._draw_char(
-                text[i], x + (i * (self._font_width + 1)), y, bold)
-            if first is not None:
-                if fpos > first:
-                    fpos = first
-            if last is not None:
-                if lpos < last:
-                    lpos = last
-        lpos = min(lpos, len(self._gfxbuf)-1)
-        tl = (fpos % self._gfxbuf.width, (8*fpos // self._gfxbuf.width))
-        br = (lpos % self._gfxbuf.width, (8*lpos // self._gfxbuf.width))
+            self._draw_char(text[i], x + (i * (self._font_width + 1)), y,
+                            bold)
+        # The erased area covers all the drawn characters. Buffer positions
+        # cannot locate it, as they wrap at the right edge of the display.
+        tl = (max(x-1, 0), max(y, 0))
+        br = (min(x + self.text_width(text, bold) + 1, self._gfxbuf.width),
+              min(y + self._font_height, self._gfxbuf.height))
         self._gfxbuf.invalidate(tl, br)
 
     def text_width(self, text, bold=False):
@@ -0,0 +1,172 @@
+"""Bulk bit manipulation for display page packing.
+
+   Two interchangeable backends are available: a pure standard library
+   one, based on big integer shifts, bytes.translate lookup tables and
+   buffer slicing, and a NumPy one. Glyph and row sized work always uses the
+   pure backend, which is faster there. NumPy is only imported, if
+   available, the first time a large image is packed, unless the
+   BITPACK_BACKEND environment variable is set to 'pure'.
+
+   See test_bitpack.py for the backend checks.
+"""
+
+from functools import lru_cache
+from os import environ
+
+# Map any non-zero pixel value to 1
+NONZERO = bytes([0] + [1]*255)
+# Shift each byte left by 0-7 bits, dropping the overflowing bits
+SHIFT_LEFT = [bytes([(value << shift) & 0xff for value in range(256)])
+              for shift in range(8)]
+# Keep the bits of each byte that overflow a left shift by 0-7 bits
+SHIFT_OVERFLOW = [bytes([(value << shift) >> 8 for value in range(256)])
+                  for shift in range(8)]
+# Count of pixels from which pages are packed with NumPy. Below, the pure
+# backend is fast enough not to pay for importing NumPy.
+NUMPY_MIN_PIXELS = 32768
+
+
+class PureBackend:
+    """Standard library backend"""
+
+    name = 'pure'
+
+    @staticmethod
+    def or_bytes(first, second):
+        """Bitwise OR of two byte sequences of the same length"""
+        return (int.from_bytes(first, 'little') |
+                int.from_bytes(second, 'little')).to_bytes(len(first),
+                                                           'little')
+
+    @staticmethod
+    def pages_from_rows(rows, shift=0):
+        """Pack rows of pixels into display pages, LSB on top.
+
+           :param rows: sequence of rows of the same width, with one byte
+                        per pixel, whose value is either 0 or 1
+           :param shift: count of rows to shift the pixels down, 0-7
+           :return: list of page bytes
+        """
+        if not rows:
+            return []
+        width = len(rows[0])
+        pages = [0] * ((shift + len(rows) + 7) // 8)
+        for pos, row in enumerate(rows, start=shift):
+            # as each byte is 0 or 1, shifting never carries to a neighbour
+            pages[pos >> 3] |= int.from_bytes(row, 'little') << (pos & 7)
+        return [page.to_bytes(width, 'little') for page in pages]
+
+    @classmethod
+    def shift_glyph(cls, data, bpc, shift=0):
+        """Transpose and shift a column-major glyph into display pages.
+
+           :param data: glyph columns, each made of bpc bytes, LSB on top
+           :param bpc: count of bytes per column
+           :param shift: count of rows to shift the glyph down, 0-7
+           :return: list of page bytes, with one more page if shifted
+        """
+        pages = [bytes(data[page::bpc]) for page in range(bpc)]
+        if not shift:
+            return pages
+        shifted = []
+        overflow = None
+        for page in pages:
+            value = page.translate(SHIFT_LEFT[shift])
+            if overflow:
+                value = cls.or_bytes(value, overflow)
+            shifted.append(value)
+            overflow = page.translate(SHIFT_OVERFLOW[shift])
+        shifted.append(overflow)
+        return shifted
+
+
+class NumPyBackend:
+    """NumPy backend"""
+
+    name = 'numpy'
+
+    @staticmethod
+    def or_bytes(first, second):
+        from numpy import frombuffer, uint8
+        return (frombuffer(first, dtype=uint8) |
+                frombuffer(second, dtype=uint8)).tobytes()
+
+    @staticmethod
+    def pages_from_rows(rows, shift=0):
+        import numpy as np
+        if not rows:
+            return []
+        width = len(rows[0])
+        count = (shift + len(rows) + 7) // 8
+        bits = np.zeros((8*count, width), dtype=np.uint8)
+        bits[shift:shift+len(rows)] = np.frombuffer(
+            b''.join(rows), dtype=np.uint8).reshape(len(rows), width)
+        # weighted sum of the 8 rows of each page, as packbits is slow
+        # across rows
+        weights = (1 << np.arange(8, dtype=np.uint8)).reshape(1, 8, 1)
+        pages = (bits.reshape(count, 8, width) * weights).sum(
+            axis=1, dtype=np.uint8)
+        return [page.tobytes() for page in pages]
+
+    @staticmethod
+    def shift_glyph(data, bpc, shift=0):
+        import numpy as np
+        columns = np.frombuffer(bytes(data), dtype=np.uint8).reshape(-1, bpc)
+        values = np.zeros(len(columns), dtype=np.uint64)
+        for page in range(bpc):
+            values |= columns[:, page].astype(np.uint64) << np.uint64(8*page)
+        values <<= np.uint64(shift)
+        count = bpc + int(bool(shift))
+        return [((values >> np.uint64(8*page)) & np.uint64(0xff)).astype(
+                np.uint8).tobytes() for page in range(count)]
+
+
+@lru_cache(maxsize=None)
+def get_backend(name=None):
+    """Select the backend for large images, by name or from the
+       availability of NumPy.
+    """
+    name = name or environ.get('BITPACK_BACKEND')
+    if name != PureBackend.name:
+        try:
+            import numpy  # noqa: F401
+            return NumPyBackend
+        except ImportError:
+            if name == NumPyBackend.name:
+                raise
+    return PureBackend
+
+
+or_bytes = PureBackend.or_bytes
+shift_glyph = PureBackend.shift_glyph
+
+
+def pages_from_rows(rows, shift=0):
+    """Pack rows of pixels into display pages, LSB on top, see
+       PureBackend.pages_from_rows().
+    """
+    if not rows or len(rows)*len(rows[0]) < NUMPY_MIN_PIXELS:
+        return PureBackend.pages_from_rows(rows, shift)
+    return get_backend().pages_from_rows(rows, shift)
+
+
+def or_into(buffer, offset, data):
+    """OR some bytes into a buffer, at an offset"""
+    end = offset + len(data)
+    buffer[offset:end] = or_bytes(buffer[offset:end], data)
+
+
+def pixel_rows(img):
+    """Extract the rows of an image, with one 0 or 1 byte per pixel,
+       1 standing for a non-zero value of the first band.
+    """
+    width, height = img.size
+    if img.mode == '1':
+        img = img.convert('L')
+    elif img.mode not in ('L', 'P'):
+        img = img.getchannel(0)
+    if img.mode in ('L', 'P'):
+        data = img.tobytes().translate(NONZERO)
+    else:
+        data = bytes([int(bool(value)) for value in img.getdata()])
+    return [data[pos:pos+width] for pos in range(0, width*height, width)]
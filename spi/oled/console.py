@@ -0,0 +1,69 @@
+from bitmapfont import BitmapFont
+from oled import GfxBuffer
+
+
+class Console:
+    """Rolling log console, using the display GDDRAM as a ring buffer.
+
+       Each new line is only rendered into the next page row, then the
+       display start line is moved so that this line shows at the bottom.
+       Appending a line therefore costs one page row and a command, whatever
+       the screen holds.
+    """
+
+    def __init__(self, display, font_name='font5x8.bin', bold=False):
+        self._display = display
+        self._font_name = font_name
+        self._bold = bold
+        self._font = None
+        self._pages = 0
+        self._line = None
+        self._head = 0
+
+    def open(self):
+        with BitmapFont(None, self._font_name) as bf:
+            self._pages = BitmapFont.byte_count_for_height(bf.height())
+        self._line = GfxBuffer(None, self._display.WIDTH, 8*self._pages)
+        self._font = BitmapFont(self._line, self._font_name)
+        self._font.init()
+        self.clear()
+
+    def close(self):
+        """Leave console mode and restore the frame buffer content"""
+        self._font.deinit()
+        self._display.set_start_line(0)
+        self._display.gfxbuf.invalidate()
+        self._display.gfxbuf.paint()
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.close()
+
+    @property
+    def page_count(self):
+        return self._display.HEIGHT // 8
+
+    def clear(self):
+        """Blank the console"""
+        blank = bytes(self._display.WIDTH)
+        for page in range(self.page_count):
+            self._display.set_cursor(page, 0)
+            self._display.write_buffer(blank)
+        self._head = 0
+        self._display.set_start_line(0)
+
+    def write(self, text):
+        """Append a line of text at the bottom of the console"""
+        self._line.buffer[:] = bytes(len(self._line))
+        self._font.text(text, 0, 0, self._bold)
+        width = self._display.WIDTH
+        for pos in range(self._pages):
+            page = (self._head + pos) % self.page_count
+            self._display.set_cursor(page, 0)
+            self._display.write_buffer(
+                self._line.buffer[pos*width:(pos+1)*width])
+        self._head = (self._head + self._pages) % self.page_count
+        self._display.set_start_line(8*self._head)
@@ -0,0 +1,99 @@
+from threading import Event, Thread
+
+
+class ContrastRamp(Thread):
+    """Contrast ramp, sent as a short stream of contrast commands.
+
+       The display port should be owned by a display worker, see
+       Ssd1306.start_worker(), so that the ramp commands are serialized
+       with the other transfers.
+    """
+
+    def __init__(self, display, start, end, duration, steps=16,
+                 pulse=False):
+        super().__init__(name='ContrastRamp', daemon=True)
+        self._display = display
+        self._start = start
+        self._end = end
+        self._interval = duration/steps
+        self._steps = steps
+        self._pulse = pulse
+        self._cancel = Event()
+
+    def run(self):
+        start, end = self._start, self._end
+        while True:
+            for step in range(1, self._steps+1):
+                if self._cancel.wait(self._interval):
+                    return
+                self._display.set_contrast(
+                    start + (end-start)*step//self._steps)
+            if not self._pulse:
+                return
+            start, end = end, start
+
+    def cancel(self):
+        self._cancel.set()
+        if self.is_alive():
+            self.join()
+
+
+class Effects:
+    """Cancelable visual effects, offloaded to the SSD1306 controller.
+
+       Fade out, blink and zoom are run by the controller, and contrast
+       ramps only cost a few command bytes per step, so that all effects
+       keep running while the frame buffer is updated.
+    """
+
+    def __init__(self, display):
+        self._display = display
+        self._ramp = None
+        self._contrast = None
+
+    def fade_out(self, frames=8):
+        self._display.fade(self._display.FADE_OUT, frames)
+
+    def blink(self, frames=8):
+        self._display.fade(self._display.FADE_BLINK, frames)
+
+    def zoom(self, enable=True):
+        self._display.zoom(enable)
+
+    def ramp(self, end, duration, start=None, steps=16, pulse=False):
+        """Start a contrast ramp, cancelling any previous one.
+           The display worker should be running, see Ssd1306.start_worker(),
+           as it serializes the ramp commands with the frame buffer updates.
+
+           :param end: final contrast
+           :param duration: ramp duration in seconds
+           :param start: initial contrast, default to the current one
+           :param steps: count of contrast commands
+           :param pulse: whether to ramp back and forth until cancelled
+           :return: the running ramp
+        """
+        if not self._display._worker:
+            raise RuntimeError('Contrast ramps require the display worker')
+        self.cancel_ramp()
+        if self._contrast is None:
+            self._contrast = self._display.contrast
+        if start is None:
+            start = self._display.contrast
+        self._ramp = ContrastRamp(self._display, start, end, duration, steps,
+                                  pulse)
+        self._ramp.start()
+        return self._ramp
+
+    def cancel_ramp(self):
+        if self._ramp:
+            self._ramp.cancel()
+            self._ramp = None
+
+    def cancel(self):
+        """Stop all effects and restore the original contrast"""
+        self.cancel_ramp()
+        self._display.fade(self._display.FADE_OFF)
+        self._display.zoom(False)
+        if self._contrast is not None:
+            self._display.set_contrast(self._contrast)
+            self._contrast = None
@@ -1,10 +1,52 @@
 #!/usr/bin/env python3
 
+from bitpack import or_into, pages_from_rows, pixel_rows
+from collections import deque
+from functools import lru_cache
 from os import environ, uname
 from sys import argv, stdout
+from threading import Condition, Thread
 from time import sleep, time as now
 
 
+@lru_cache(maxsize=16)
+def _qr_segments(msg, scale, x, y, width, height):
+    """Build the QR matrix of a message and pack its scaled modules into
+       display page segments, as consumed by GfxBuffer.copy_segments.
+
+       Light modules (including the quiet zone) are lit pixels.
+    """
+    from qrcode import QRCode
+    qr = QRCode(border=2)
+    qr.add_data(msg)
+    qr.make(fit=True)
+    matrix = qr.get_matrix()
+    size = len(matrix)*scale
+    qr_width = min(size, width-x)
+    qr_height = min(size, height-y)
+    if x < 0 or y < 0 or qr_width <= 0 or qr_height <= 0:
+        return (), None, None
+    yoff = y & 7
+    fill = (1 << scale) - 1
+    clip = ((1 << qr_height) - 1) << yoff
+    columns = []
+    for mcol in range(len(matrix)):
+        bits = 0
+        for mrow, row in enumerate(matrix):
+            if not row[mcol]:
+                bits |= fill << (mrow*scale)
+        columns.extend([(bits << yoff) & clip] * scale)
+    columns = columns[:qr_width]
+    segments = []
+    page = y >> 3
+    for shift in range(0, yoff+qr_height, 8):
+        mask = (clip >> shift) & 0xff
+        data = bytes([(bits >> shift) & 0xff for bits in columns])
+        segments.append((page*width + x, data, mask))
+        page += 1
+    return tuple(segments), (x, y), (x+qr_width, y+qr_height)
+
+
 class GfxBuffer:
     """
     """
@@ -22,18 +64,79 @@ class GfxBuffer:
 
     def copy_bitmap(self, img, x=0, y=0):
         width, height = img.size
-        buf = img.getdata(0)
-        for pos, pixel in enumerate(buf):
-            row = pos % width
-            col = pos // width
-            xoff = row + x
-            if xoff >= self.width:
+        width = min(width, self.width-x)
+        height = min(height, self.height-y)
+        if width <= 0 or height <= 0:
+            return
+        rows = [row[:width] for row in pixel_rows(img)[:height]]
+        for page, data in enumerate(pages_from_rows(rows, y & 7),
+                                    start=y >> 3):
+            or_into(self.buffer, x + page*self.width, data)
+
+    def clear(self):
+        self.buffer[:] = bytes(len(self.buffer))
+        self.invalidate()
+
+    def copy_segments(self, segments, tl, br):
+        """Copy pre-packed page segments into the buffer.
+
+           Each segment is an (offset, data, mask) tuple, where mask selects
+           the bits of each byte of data that replace the buffer content.
+        """
+        for offset, data, mask in segments:
+            end = offset + len(data)
+            if mask == 0xff:
+                self.buffer[offset:end] = data
                 continue
-            yoff = col + y
-            if yoff >= self.height:
+            imask = ~mask & 0xff
+            for pos, bits in zip(range(offset, end), data):
+                self.buffer[pos] = (self.buffer[pos] & imask) | bits
+        if segments:
+            self.invalidate(tl, br)
+
+    def fill_rect(self, x, y, width, height, color=False):
+        """Set or clear all the pixels of a rectangle"""
+        if x < 0:
+            width, x = width + x, 0
+        if y < 0:
+            height, y = height + y, 0
+        width = min(width, self.width-x)
+        height = min(height, self.height-y)
+        if width <= 0 or height <= 0:
+            return
+        clip = ((1 << height) - 1) << (y & 7)
+        fill = bytes([color and 0xff or 0]) * width
+        for shift in range(0, (y & 7) + height, 8):
+            mask = (clip >> shift) & 0xff
+            pos = ((y >> 3) + shift//8)*self.width + x
+            if mask == 0xff:
+                self.buffer[pos:pos+width] = fill
+            elif color:
+                for xix in range(pos, pos+width):
+                    self.buffer[xix] |= mask
+            else:
+                imask = ~mask & 0xff
+                for xix in range(pos, pos+width):
+                    self.buffer[xix] &= imask
+        self.invalidate((x, y), (x+width, y+height))
+
+    def draw_sprite(self, sprite, x=0, y=0):
+        """Copy a pre-compiled sprite, see sprites.py, into the buffer"""
+        if x < 0 or y < 0 or x >= self.width or y >= self.height:
+            return
+        shift = y & 7
+        data = sprite._pages_view(shift)
+        width = min(sprite.width, self.width-x)
+        first_page = y >> 3
+        segments = []
+        for page, mask in enumerate(sprite.page_masks(shift)):
+            if first_page + page >= self.height//8:
                 break
-            if pixel:
-                self.buffer[xoff + (yoff >> 3)*self.width] |= 1 << (yoff & 7)
+            start = page*sprite.width
+            segments.append(((first_page + page)*self.width + x,
+                             data[start:start+width], mask))
+        self.copy_segments(segments, (x, y),
+                           (x+width, min(y+sprite.height, self.height)))
 
     def invalidate(self, tl=None, br=None):
         if not tl:
@@ -52,21 +155,122 @@ class GfxBuffer:
                 self._br[1] = br[1]
 
     def paint(self):
-        x, y = self._tl[0], self._tl[1] & ~0x7
-        last_y = (self._br[1]+7) & ~0x7
-        width = self._br[0]-self._tl[0] + 1
-        count = 0
-        while y < last_y:
-            self.display.set_cursor(y//8, x)
-            start = x + y*self.width//8
-            end = start + width
-            self.display.write_buffer(self.buffer[start:end])
-            count += (end-start)
-            y += 8
+        if self._tl[0] <= self._br[0] and self._tl[1] < self._br[1]:
+            self.display.write_frame(self.buffer, tuple(self._tl),
+                                     tuple(self._br))
         self._tl = [self.width, self.height]
         self._br = [0, 0]
 
 
+class DisplayWorker:
+    """Background thread which owns a display port.
+
+       Commands and data are forwarded in order. Frames which have not been
+       sent yet are merged: the latest frame content wins and dirty areas
+       are combined. An optional maximum frame rate caps the bus usage.
+    """
+
+    def __init__(self, port, max_fps=None):
+        self._port = port
+        self._period = max_fps and 1.0/max_fps or 0.0
+        self._queue = deque()
+        self._cond = Condition()
+        self._thread = None
+        self._busy = False
+        self._error = None
+        self._last_frame = 0.0
+
+    def start(self):
+        if self._thread:
+            return
+        self._thread = Thread(target=self._run, name='DisplayWorker',
+                              daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Send all pending requests, then terminate the thread"""
+        if not self._thread:
+            return
+        self._put(None, None)
+        self._thread.join()
+        self._thread = None
+        self._raise_error()
+
+    def flush(self):
+        """Wait for all pending requests to be sent to the display"""
+        with self._cond:
+            while self._queue or self._busy:
+                self._cond.wait()
+        self._raise_error()
+
+    def reset(self):
+        self._put(self._port.reset, ())
+
+    def write_command(self, data):
+        self._put(self._port.write_command, (bytes(data),))
+
+    def write_data(self, data):
+        self._put(self._port.write_data, (bytes(data),))
+
+    def submit_frame(self, painter, buffer, tl, br):
+        """Queue a frame, merging it with a pending frame if any.
+
+           :param painter: callable(buffer, tl, br) to send the frame
+           :param buffer: snapshot of the frame buffer
+           :param tl: top-left corner of the dirty area
+           :param br: bottom-right corner of the dirty area
+        """
+        with self._cond:
+            if self._queue:
+                item = self._queue[-1]
+                if item[2]:
+                    _, ptl, pbr = item[1]
+                    tl = (min(tl[0], ptl[0]), min(tl[1], ptl[1]))
+                    br = (max(br[0], pbr[0]), max(br[1], pbr[1]))
+                    item[1] = (buffer, tl, br)
+                    return
+            self._queue.append([painter, (buffer, tl, br), True])
+            self._cond.notify_all()
+
+    def _put(self, func, args):
+        with self._cond:
+            self._queue.append([func, args, False])
+            self._cond.notify_all()
+
+    def _raise_error(self):
+        error, self._error = self._error, None
+        if error:
+            raise error
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._busy = False
+                self._cond.notify_all()
+                while not self._queue:
+                    self._cond.wait()
+                func, args, frame = self._queue[0]
+                if frame and self._period:
+                    delay = self._last_frame + self._period - now()
+                    if delay > 0:
+                        # let more frames be merged while waiting
+                        self._cond.wait(delay)
+                        continue
+                func, args, frame = self._queue.popleft()
+                self._busy = True
+            if not func:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+                return
+            try:
+                func(*args)
+            except Exception as ex:
+                self._error = ex
+            if frame:
+                self._last_frame = now()
+
+
 class Ssd1306:
     """
     """
@@ -121,14 +325,62 @@ class Ssd1306:
     FADE_OUT_BLINK_CMD = 0X23
     ZOOM_IN_CMD = 0xD6
 
+    FADE_OFF = 0x00
+    FADE_OUT = 0x20
+    FADE_BLINK = 0x30
+    DEFAULT_CONTRAST = 0x70
+
+    # Scroll step intervals, in frames, indexed by their command value
+    SCROLL_INTERVALS = (5, 64, 128, 256, 3, 4, 25, 2)
+
     WIDTH = 128
     HEIGHT = 64
+    # Approximate frame rate with the clock and precharge settings of the
+    # initialization sequence
+    FRAME_RATE = 88
 
     def __init__(self, interface):
+        self._port = interface
         self._if = interface
+        self._worker = None
+        self._fonts = {}
+        self.contrast = self.DEFAULT_CONTRAST
         # self._gddram = bytearray(self.WIDTH*self.HEIGHT//8)
         self.gfxbuf = GfxBuffer(self, self.WIDTH, self.HEIGHT)
 
+    def close(self):
+        """Release the fonts and close the port"""
+        self.stop_worker()
+        for bf in self._fonts.values():
+            bf.deinit()
+        self._fonts.clear()
+        self._port.close()
+
+    def start_worker(self, max_fps=None):
+        """Hand the port over to a background thread, so that painting
+           the frame buffer no longer blocks the caller.
+        """
+        if self._worker:
+            return
+        self._worker = DisplayWorker(self._port, max_fps)
+        self._worker.start()
+        self._if = self._worker
+
+    def stop_worker(self):
+        """Send all pending frames and get the port back"""
+        if not self._worker:
+            return
+        worker, self._worker = self._worker, None
+        self._if = self._port
+        worker.stop()
+
+    def flush(self):
+        """Wait for all pending frames and commands to be sent.
+           Should be called before closing the port.
+        """
+        if self._worker:
+            self._worker.flush()
+
     def initialize(self):
         init_sequence = bytes((
             self.DISPLAY_OFF_CMD,
@@ -142,17 +394,78 @@ class Ssd1306:
             self.SEGMENT_REMAP_HIGH_CMD,
             self.SCAN_DIR_REVERSE_CMD,
             self.COMM_PINS_CFG_CMD, self.COMM_PINS_CFG_DEFAULT,
-            self.DISPLAY_CONTRAST_CMD, 0x70,
+            self.DISPLAY_CONTRAST_CMD, self.DEFAULT_CONTRAST,
             self.PRECHARGE_PEDIOD_CMD, 0xf1,
             self.VCOMM_DESELECT_LEVEL_CMD, 0x40,
             self.DISPLAY_ON_CMD))
         self._if.reset()
         self._if.write_command(init_sequence)
+        self.contrast = self.DEFAULT_CONTRAST
 
     def invert(self, mode=True):
         self._if.write_command(bytes([mode and self.DISPLAY_INV_CMD or
                                       self.DISPLAY_REG_CMD]))
 
+    def set_contrast(self, value):
+        self._if.write_command(bytes([self.DISPLAY_CONTRAST_CMD,
+                                      value & 0xff]))
+        self.contrast = value & 0xff
+
+    def fade(self, mode, frames=8):
+        """Control the fade out or blink engine of the controller.
+
+           :param mode: one of FADE_OFF, FADE_OUT, FADE_BLINK
+           :param frames: count of frames between each contrast step,
+                          a multiple of 8 in [8, 128]
+        """
+        if not 8 <= frames <= 128 or frames % 8:
+            raise ValueError('Unsupported fade interval: %d frames' % frames)
+        self._if.write_command(bytes([self.FADE_OUT_BLINK_CMD,
+                                      mode | (frames//8 - 1)]))
+
+    def zoom(self, enable=True):
+        """Double the height of the upper half of the display"""
+        self._if.write_command(bytes([self.ZOOM_IN_CMD, int(bool(enable))]))
+
+    def scroll(self, start_page, end_page, frames=5, left=True, vertical=0):
+        """Start the continuous scroll of a band of pages.
+
+           :param start_page: first page of the band
+           :param end_page: last page of the band
+           :param frames: count of frames between each scroll step, should
+                          be one of SCROLL_INTERVALS
+           :param left: scroll direction
+           :param vertical: vertical offset in rows for each step, for a
+                            diagonal scroll within the band
+        """
+        try:
+            interval = self.SCROLL_INTERVALS.index(frames)
+        except ValueError:
+            raise ValueError('Unsupported scroll interval: %d frames' %
+                             frames)
+        command = [self.SCROLL_OFF_CMD]
+        if vertical:
+            command.extend((self.SCROLL_CFG_V_AREA_CMD,
+                            8*start_page, 8*(end_page-start_page+1)))
+            command.append(left and self.SCROLL_CFG_V_LEFT_CMD or
+                           self.SCROLL_CFG_V_RIGHT_CMD)
+            command.extend((0x00, start_page, interval, end_page, vertical))
+        else:
+            command.append(left and self.SCROLL_CFG_H_LEFT_CMD or
+                           self.SCROLL_CFG_H_RIGHT_CMD)
+            command.extend((0x00, start_page, interval, end_page, 0x00, 0xff))
+        command.append(self.SCROLL_START_CMD)
+        self._if.write_command(bytes(command))
+
+    def stop_scroll(self):
+        """Stop scrolling. Scrolled pages need to be rewritten."""
+        self._if.write_command(bytes([self.SCROLL_OFF_CMD]))
+
+    def set_start_line(self, line):
+        """Select the GDDRAM row shown on top of the display"""
+        self._if.write_command(bytes([self.START_LINE_BASE_CMD |
+                                      (line % self.HEIGHT)]))
+
     def set_page_address(self, address):
         command = self.ADDRESS_SET_PAGES_CMD + address
         self._if.write_command([command])
@@ -172,27 +485,69 @@ class Ssd1306:
     def write_buffer(self, buf):
         self._if.write_data(buf)
 
-    def qrcode(self, msg):
+    def write_frame(self, buffer, tl, br):
+        """Send the pages of a frame buffer which cover a dirty area"""
+        if self._worker:
+            self._worker.submit_frame(self._write_pages, bytes(buffer), tl, br)
+        else:
+            self._write_pages(buffer, tl, br)
+
+    def _write_pages(self, buffer, tl, br):
+        # always called from the thread which owns the port
+        x, y = tl[0], tl[1] & ~0x7
+        last_y = (br[1]+7) & ~0x7
+        width = br[0]-tl[0] + 1
+        while y < last_y:
+            line = y//8
+            self._port.write_command(bytes([
+                self.ADDRESS_SET_PAGES_CMD | line,
+                self.ADDRESS_SET_HIGH_COL_CMD | (x >> 4),
+                self.ADDRESS_SET_LOW_COL_CMD | (x & ((1 << 4) - 1))]))
+            start = x + line*self.WIDTH
+            # do not wrap over the next page
+            end = min(start + width, (line+1)*self.WIDTH)
+            self._port.write_data(buffer[start:end])
+            y += 8
+
+    def qrcode(self, msg, x=0, y=0, scale=2):
+        """Show a QR code, each module being scale x scale pixels.
+
+           Packed QR codes are cached, so showing again a recent message at
+           the same location only costs the SPI transfer.
+        """
+        self.draw_qrcode(msg, x, y, scale)
+        self.gfxbuf.paint()
+
+    def draw_qrcode(self, msg, x=0, y=0, scale=2):
+        """Draw a QR code into the frame buffer, without painting it.
+
+           :return: the top-left and bottom-right corners of the QR code
+        """
         try:
-            from qrcode import QRCode
+            segments, tl, br = _qr_segments(msg, scale, x, y,
+                                            self.WIDTH, self.HEIGHT)
         except ImportError as ex:
-            self.log.critical('PIL and QRCode modules are required')
-        qr = QRCode(box_size=2, border=2)
-        qr.add_data(msg)
-        qr.make(fit=True)
-        img = qr.make_image(fill_color="black", back_color="white")
-        self.gfxbuf.copy_bitmap(img)
-        self.gfxbuf.paint()
+            raise RuntimeError('QRCode module is required') from ex
+        self.gfxbuf.copy_segments(segments, tl, br)
+        return tl, br
+
+    def get_font(self, font='font5x8.bin'):
+        """Get a font drawing into the frame buffer, loading it once"""
+        bf = self._fonts.get(font)
+        if not bf:
+            from bitmapfont import BitmapFont
+            bf = BitmapFont(self.gfxbuf, font)
+            bf.init()
+            self._fonts[font] = bf
+        return bf
 
-    def text(self, msg, x=0, y=0, **kwargs):
-        from bitmapfont import BitmapFont
-        font = 'font%dx%d.bin' % (int(argv[1]), int(argv[2]))
-        with BitmapFont(self.gfxbuf, font) as bf:
-            bf.text(msg, x, y, **kwargs)
+    def text(self, msg, x=0, y=0, font='font5x8.bin', **kwargs):
+        self.get_font(font).text(msg, x, y, **kwargs)
         self.gfxbuf.paint()
 
 
-def main():
+def get_display():
+    """Open the display port and initialize the display"""
     machine = uname().machine
     # quick and unreliable way to detect RPi for now
     if machine == 'armv7l':
@@ -204,18 +559,35 @@ def main():
     disp = Ssd1306(port)
     disp.initialize()
     disp.invert(False)
+    return disp
+
+
+def main():
+    width, height = int(argv[1]), int(argv[2])
+    lines = [(10, 30+(argc-3)*int(height*1.2), argv[argc])
+             for argc in range(3, len(argv))]
+    # use the display server if one is running
+    from oledd import DisplayClient
+    try:
+        with DisplayClient() as client:
+            client.clear()
+            for x, y, msg in lines:
+                client.text(msg, x, y, width, height, bold=True)
+        return
+    except OSError:
+        pass
+    disp = get_display()
     # disp.qrcode(argv[3])
     # disp.invert(True)
-    # print(len(argv))
-    for argc in range(3, len(argv)):
-        disp.text(argv[argc], 10, 30+(argc-3)*int(int(argv[2])*1.2), bold=True)
+    font = 'font%dx%d.bin' % (width, height)
+    for x, y, msg in lines:
+        disp.text(msg, x, y, font, bold=True)
     # disp.text("next", 5, 21)
     # prevent SPI glitches as screen does not support a /CS line
     sleep(0.1)
-    port.close()
+    disp.close()
 
 
 if __name__ == '__main__':
     # oled.py <width> <height> <text> [text...]
     main()
-
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+
+"""Display server, which keeps the display port open and the display
+   initialized, and accepts draw requests over a local Unix socket.
+
+   Each request is a header, made of a one-byte opcode and the little
+   endian 16-bit length of its payload, followed by the payload. The
+   server replies with a one-byte status for each request.
+"""
+
+from os import environ, unlink
+from os.path import exists
+from signal import SIGTERM, signal
+from socket import AF_UNIX, SOCK_STREAM, socket
+from socketserver import StreamRequestHandler, UnixStreamServer
+from struct import Struct
+from time import sleep
+
+SOCKET_PATH = environ.get('OLED_SOCKET', '/tmp/oled.sock')
+
+HEADER = Struct('<BH')
+# font width, font height, x, y, bold; followed with UTF-8 text
+TEXT = Struct('<BBhhB')
+# x, y, scale; followed with UTF-8 message
+QRCODE = Struct('<hhB')
+
+OP_CLEAR = 1
+OP_TEXT = 2
+OP_QRCODE = 3
+OP_INVERT = 4
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+
+class DisplayClient:
+    """Thin client of the display server.
+       Opening the client raises an OSError if no server is running.
+    """
+
+    def __init__(self, path=None):
+        self._path = path or SOCKET_PATH
+        self._sock = None
+        self._rfile = None
+
+    def open(self):
+        sock = socket(AF_UNIX, SOCK_STREAM)
+        try:
+            sock.connect(self._path)
+        except OSError:
+            sock.close()
+            raise
+        self._sock = sock
+        self._rfile = sock.makefile('rb')
+
+    def close(self):
+        self._rfile.close()
+        self._sock.close()
+        self._sock = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.close()
+
+    def clear(self):
+        self._request(OP_CLEAR)
+
+    def text(self, msg, x, y, font_width, font_height, bold=False):
+        self._request(OP_TEXT,
+                      TEXT.pack(font_width, font_height, x, y, int(bold)) +
+                      msg.encode('utf8'))
+
+    def qrcode(self, msg, x=0, y=0, scale=2):
+        self._request(OP_QRCODE, QRCODE.pack(x, y, scale) + msg.encode('utf8'))
+
+    def invert(self, mode=True):
+        self._request(OP_INVERT, bytes([int(mode)]))
+
+    def _request(self, opcode, payload=b''):
+        self._sock.sendall(HEADER.pack(opcode, len(payload)) + payload)
+        status = self._rfile.read(1)
+        if not status:
+            raise ConnectionError('Display server closed the connection')
+        if status[0] != STATUS_OK:
+            raise RuntimeError('Display server rejected request %d' % opcode)
+
+
+class DisplayRequestHandler(StreamRequestHandler):
+    """Execute the requests of a client connection"""
+
+    def handle(self):
+        while True:
+            header = self.rfile.read(HEADER.size)
+            if len(header) < HEADER.size:
+                return
+            opcode, length = HEADER.unpack(header)
+            payload = self.rfile.read(length)
+            try:
+                self.server.execute(opcode, payload)
+                status = STATUS_OK
+            except Exception as ex:
+                print('Request %d failed: %s' % (opcode, ex))
+                status = STATUS_ERROR
+            self.wfile.write(bytes([status]))
+
+
+class DisplayServer(UnixStreamServer):
+    """Serve draw requests, one client connection at a time.
+
+       The display may be assigned once the socket is bound, so that the
+       panel is never opened while another server owns it.
+    """
+
+    def __init__(self, display=None, path=None):
+        self.display = display
+        self.path = path or SOCKET_PATH
+        if exists(self.path):
+            # only remove a stale socket, left over by a dead server
+            try:
+                with DisplayClient(self.path):
+                    pass
+            except OSError:
+                unlink(self.path)
+            else:
+                raise RuntimeError('A display server is already running')
+        super().__init__(self.path, DisplayRequestHandler)
+
+    def server_close(self):
+        super().server_close()
+        if exists(self.path):
+            unlink(self.path)
+
+    def execute(self, opcode, payload):
+        if opcode == OP_CLEAR:
+            self.display.gfxbuf.clear()
+            self.display.gfxbuf.paint()
+        elif opcode == OP_TEXT:
+            width, height, x, y, bold = TEXT.unpack_from(payload)
+            msg = payload[TEXT.size:].decode('utf8')
+            font = 'font%dx%d.bin' % (width, height)
+            self.display.text(msg, x, y, font, bold=bool(bold))
+        elif opcode == OP_QRCODE:
+            x, y, scale = QRCODE.unpack_from(payload)
+            msg = payload[QRCODE.size:].decode('utf8')
+            self.display.qrcode(msg, x, y, scale)
+        elif opcode == OP_INVERT:
+            self.display.invert(bool(payload[0]))
+        else:
+            raise ValueError('Unknown opcode %d' % opcode)
+
+
+def main():
+    from oled import get_display
+    # bind first, which fails if a server is already running
+    server = DisplayServer()
+    disp = None
+
+    def terminate(signum, frame):
+        raise KeyboardInterrupt()
+
+    signal(SIGTERM, terminate)
+    try:
+        disp = server.display = get_display()
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if disp:
+            # prevent SPI glitches as screen does not support a /CS line
+            sleep(0.1)
+            disp.close()
+
+
+if __name__ == '__main__':
+    main()
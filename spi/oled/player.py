@@ -0,0 +1,136 @@
+"""Stream animations or live previews to the display.
+
+   Frames are converted to monochrome with vectorized NumPy operations,
+   packed into the display page format and only the area which differs
+   from the previous frame is sent.
+"""
+
+from collections import namedtuple
+from time import sleep, time as now
+import numpy as np
+
+PlaybackStats = namedtuple('PlaybackStats', 'shown dropped fps latency')
+"""Playback statistics: count of shown and dropped frames, achieved frame
+   rate and average latency in seconds, from frame retrieval to paint.
+"""
+
+# 8x8 Bayer matrix, as thresholds in [0, 255]
+BAYER8 = np.array((
+    (0, 32, 8, 40, 2, 34, 10, 42),
+    (48, 16, 56, 24, 50, 18, 58, 26),
+    (12, 44, 4, 36, 14, 46, 6, 38),
+    (60, 28, 52, 20, 62, 30, 54, 22),
+    (3, 35, 11, 43, 1, 33, 9, 41),
+    (51, 19, 59, 27, 49, 17, 57, 25),
+    (15, 47, 7, 39, 13, 45, 5, 37),
+    (63, 31, 55, 23, 61, 29, 53, 21)), dtype=np.uint16) * 4 + 2
+
+
+class Player:
+    """Frame playback pipeline.
+
+       :param display: Ssd1306 display
+       :param fps: target frame rate
+       :param dither: 'threshold', 'ordered' or 'floyd' (Floyd-Steinberg,
+                      which requires PIL)
+       :param threshold: luminance threshold for the 'threshold' mode
+    """
+
+    DITHERS = ('threshold', 'ordered', 'floyd')
+
+    def __init__(self, display, fps=25, dither='ordered', threshold=128):
+        if dither not in self.DITHERS:
+            raise ValueError('Unsupported dithering: %s' % dither)
+        if dither == 'floyd':
+            # fail early rather than on the first frame
+            from PIL import Image  # noqa: F401
+        self._display = display
+        self._gfxbuf = display.gfxbuf
+        self._period = 1.0/fps
+        self._dither = dither
+        self._threshold = threshold
+        self._width = self._gfxbuf.width
+        self._height = self._gfxbuf.height
+        self._bayer = np.tile(BAYER8, (self._height//8, self._width//8))
+        self._last = None
+
+    def play(self, frames):
+        """Show frames, holding the target frame rate.
+
+           Frames which are late by more than a frame period are dropped.
+
+           :param frames: iterable of PIL images or NumPy arrays, either
+                          grayscale (H, W) or RGB (H, W, 3)
+           :return: PlaybackStats
+        """
+        shown = dropped = 0
+        latency = 0.0
+        start = now()
+        for index, frame in enumerate(frames):
+            received = now()
+            due = start + index*self._period
+            if received > due + self._period:
+                dropped += 1
+                continue
+            self.show(frame)
+            shown += 1
+            done = now()
+            latency += done - received
+            delay = due + self._period - done
+            if delay > 0:
+                sleep(delay)
+        elapsed = now() - start
+        return PlaybackStats(shown, dropped,
+                             elapsed and shown/elapsed or 0.0,
+                             shown and latency/shown or 0.0)
+
+    def show(self, frame):
+        """Convert, pack and send a single frame"""
+        pages = self.pack(self.dither(self.to_gray(frame)))
+        if self._last is None:
+            tl, br = (0, 0), (self._width, self._height)
+        else:
+            changed = pages != self._last
+            rows = np.flatnonzero(changed.any(axis=1))
+            if not rows.size:
+                return
+            cols = np.flatnonzero(changed.any(axis=0))
+            tl = (int(cols[0]), 8*int(rows[0]))
+            br = (int(cols[-1])+1, 8*(int(rows[-1])+1))
+        self._last = pages
+        self._gfxbuf.buffer[:] = pages.tobytes()
+        self._gfxbuf.invalidate(tl, br)
+        self._gfxbuf.paint()
+
+    def to_gray(self, frame):
+        """Convert a frame into a (H, W) uint8 luminance array"""
+        if not isinstance(frame, np.ndarray):
+            if frame.size != (self._width, self._height):
+                frame = frame.resize((self._width, self._height))
+            frame = np.asarray(frame.convert('L'))
+        elif frame.ndim == 3:
+            frame = (frame[..., :3] @ np.array((299, 587, 114))) // 1000
+        if frame.shape != (self._height, self._width):
+            raise ValueError('Invalid frame size: %dx%d' %
+                             (frame.shape[1], frame.shape[0]))
+        if frame.dtype == np.bool_:
+            return frame.astype(np.uint8) * 255
+        return frame.astype(np.uint8, copy=False)
+
+    def dither(self, gray):
+        """Convert a luminance array into a (H, W) boolean array"""
+        if self._dither == 'threshold':
+            return gray >= self._threshold
+        if self._dither == 'ordered':
+            return gray >= self._bayer
+        return self._floyd_steinberg(gray)
+
+    def pack(self, bits):
+        """Pack a boolean array into (H/8, W) page bytes, LSB on top"""
+        pages = bits.reshape(self._height//8, 8, self._width)
+        return np.packbits(pages, axis=1, bitorder='little')[:, 0, :]
+
+    def _floyd_steinberg(self, gray):
+        # error diffusion is sequential, PIL implements it natively
+        from PIL import Image
+        return np.asarray(Image.fromarray(gray).convert('1'))
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+
+"""Sprite sheets, i.e. icons pre-compiled into native panel formats.
+
+   The compiler converts a directory of images, ahead of time, into a
+   single sheet file. Each sprite is stored both in the SSD1306 page layout,
+   with one variant for each of the 8 possible y offsets within a page, and
+   in the EPD row layout. The loader memory-maps the sheet, so that drawing
+   a sprite is a slice copy, which requires neither PIL nor pixel packing.
+
+   Sheet format, all integers being little endian:
+   - header: magic, version, sprite count
+   - index: for each sprite, name length, name, width, height, offset of
+            the page layout variants, offset of the row layout
+   - data
+
+   sprites.py <image_dir> <sheet>
+"""
+
+from bitpack import pages_from_rows, pixel_rows
+from glob import glob
+from mmap import mmap, ACCESS_READ
+from os.path import basename, join as joinpath, splitext
+from struct import Struct
+from sys import argv
+
+MAGIC = b'SPRT'
+VERSION = 1
+HEADER = Struct('<4sBH')
+ENTRY = Struct('<HHII')
+IMAGE_EXTENSIONS = ('.png', '.bmp', '.gif')
+
+
+class Sprite:
+    """Pre-compiled image, whose content is a view on its sheet.
+       Accessors return copies, so the sheet may be closed at any time.
+    """
+
+    def __init__(self, name, width, height, view, page_offset, row_offset):
+        self.name = name
+        self.width = width
+        self.height = height
+        self._view = view
+        self._page_offset = page_offset
+        self._row_offset = row_offset
+
+    @classmethod
+    def page_count(cls, height, shift=0):
+        return (shift + height + 7) // 8
+
+    @property
+    def row_width(self):
+        """Count of bytes in each row of the EPD layout"""
+        return (self.width + 7) // 8
+
+    @property
+    def rows(self):
+        """Sprite in EPD layout: rows of MSB first pixels"""
+        return bytes(self._rows_view())
+
+    def pages(self, shift):
+        """Sprite in SSD1306 layout: pages of LSB on top pixel columns,
+           shifted down by 0 to 7 rows.
+        """
+        return bytes(self._pages_view(shift))
+
+    def _rows_view(self):
+        # views on the sheet must be released before closing it
+        return self._view[self._row_offset:
+                          self._row_offset + self.row_width*self.height]
+
+    def _pages_view(self, shift):
+        offset = self._page_offset
+        for pre_shift in range(shift):
+            offset += self.page_count(self.height, pre_shift) * self.width
+        return self._view[offset:
+                          offset + self.page_count(self.height, shift) *
+                          self.width]
+
+    def page_masks(self, shift):
+        """Masks of the bits covered by the sprite in each page"""
+        clip = ((1 << self.height) - 1) << shift
+        return [(clip >> (8*page)) & 0xff
+                for page in range(self.page_count(self.height, shift))]
+
+
+class SpriteSheet:
+    """Memory-mapped sprite sheet"""
+
+    def __init__(self, path):
+        self._path = path
+        self._file = None
+        self._map = None
+        self._sprites = {}
+
+    def open(self):
+        self._file = open(self._path, 'rb')
+        self._map = mmap(self._file.fileno(), 0, access=ACCESS_READ)
+        magic, version, count = HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('Unsupported sprite sheet: %s' % self._path)
+        view = memoryview(self._map)
+        offset = HEADER.size
+        for _ in range(count):
+            length = self._map[offset]
+            name = bytes(view[offset+1:offset+1+length]).decode('utf8')
+            offset += 1 + length
+            width, height, page_offset, row_offset = \
+                ENTRY.unpack_from(self._map, offset)
+            offset += ENTRY.size
+            self._sprites[name] = Sprite(name, width, height, view,
+                                         page_offset, row_offset)
+
+    def close(self):
+        for sprite in self._sprites.values():
+            sprite._view = None
+        self._sprites.clear()
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.close()
+
+    def __getitem__(self, name):
+        return self._sprites[name]
+
+    def __contains__(self, name):
+        return name in self._sprites
+
+    def names(self):
+        return sorted(self._sprites)
+
+
+def pack_pages(pixels, shift):
+    """Pack rows of 0/1 pixels into SSD1306 pages, shifted down by some
+       rows.
+    """
+    return b''.join(pages_from_rows(pixels, shift))
+
+
+def pack_rows(pixels, width):
+    """Pack rows of pixels into EPD rows, padding with white pixels"""
+    data = bytearray()
+    row_width = (width + 7) // 8
+    for row in pixels:
+        bits = 0
+        for x in range(8*row_width):
+            bits = (bits << 1) | int(x >= width or bool(row[x]))
+        data.extend(bits.to_bytes(row_width, 'big'))
+    return bytes(data)
+
+
+def compile_sheet(image_dir, sheet_path):
+    """Compile all images of a directory into a sprite sheet.
+       Sprites are named after the image file names, without extension.
+    """
+    from PIL import Image
+    paths = sorted(path for path in glob(joinpath(image_dir, '*'))
+                   if splitext(path)[1].lower() in IMAGE_EXTENSIONS)
+    entries = []
+    for path in paths:
+        image = Image.open(path).convert('1')
+        width, height = image.size
+        pixels = pixel_rows(image)
+        pages = b''.join(pack_pages(pixels, shift) for shift in range(8))
+        rows = pack_rows(pixels, width)
+        name = splitext(basename(path))[0].encode('utf8')
+        entries.append((name, width, height, pages, rows))
+    offset = HEADER.size + sum(1 + len(name) + ENTRY.size
+                               for name, *_ in entries)
+    index = bytearray(HEADER.pack(MAGIC, VERSION, len(entries)))
+    data = bytearray()
+    for name, width, height, pages, rows in entries:
+        index.append(len(name))
+        index.extend(name)
+        index.extend(ENTRY.pack(width, height, offset + len(data),
+                                offset + len(data) + len(pages)))
+        data.extend(pages)
+        data.extend(rows)
+    with open(sheet_path, 'wb') as sfp:
+        sfp.write(index)
+        sfp.write(data)
+    return len(entries)
+
+
+if __name__ == '__main__':
+    # sprites.py <image_dir> <sheet>
+    count = compile_sheet(argv[1], argv[2])
+    print('%d sprites compiled' % count)
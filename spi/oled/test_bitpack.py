@@ -0,0 +1,117 @@
+"""Check the pure bit packing backend against per-pixel references, and
+   that both backends produce identical output.
+
+   python -m unittest test_bitpack
+"""
+
+from random import Random
+from unittest import TestCase, main, skipUnless
+
+import bitpack
+from bitpack import NumPyBackend, PureBackend
+
+try:
+    import numpy  # noqa: F401
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+
+def reference_pages(rows, shift):
+    """Pack rows into pages, one pixel at a time"""
+    width = len(rows[0])
+    pages = [bytearray(width) for _ in range((shift + len(rows) + 7) // 8)]
+    for pos, row in enumerate(rows, start=shift):
+        for x, pixel in enumerate(row):
+            if pixel:
+                pages[pos // 8][x] |= 1 << (pos % 8)
+    return [bytes(page) for page in pages]
+
+
+def reference_glyph(data, bpc, shift):
+    """Shift a column-major glyph down, one column at a time"""
+    count = bpc + int(bool(shift))
+    pages = [bytearray() for _ in range(count)]
+    for pos in range(0, len(data), bpc):
+        column = int.from_bytes(data[pos:pos+bpc], 'little') << shift
+        for page in range(count):
+            pages[page].append((column >> (8*page)) & 0xff)
+    return [bytes(page) for page in pages]
+
+
+class BitpackTestCase(TestCase):
+
+    SIZES = ((1, 1), (5, 8), (13, 11), (128, 64), (296, 128))
+    GLYPHS = ((1, 1), (5, 1), (8, 2), (12, 3), (24, 4))
+
+    def setUp(self):
+        self.random = Random(1)
+
+    def rows(self, width, height):
+        return [bytes(self.random.getrandbits(1) for _ in range(width))
+                for _ in range(height)]
+
+    def random_bytes(self, length):
+        return bytes(self.random.getrandbits(8) for _ in range(length))
+
+
+class PureBackendTestCase(BitpackTestCase):
+
+    def test_pages_from_rows(self):
+        for width, height in self.SIZES:
+            rows = self.rows(width, height)
+            for shift in range(8):
+                self.assertEqual(PureBackend.pages_from_rows(rows, shift),
+                                 reference_pages(rows, shift))
+
+    def test_pages_from_rows_dispatch(self):
+        for width, height in ((16, 16), (296, 128)):
+            rows = self.rows(width, height)
+            self.assertEqual(bitpack.pages_from_rows(rows, 3),
+                             reference_pages(rows, 3))
+        self.assertEqual(bitpack.pages_from_rows([]), [])
+
+    def test_shift_glyph(self):
+        for width, bpc in self.GLYPHS:
+            glyph = self.random_bytes(width*bpc)
+            for shift in range(8):
+                self.assertEqual(PureBackend.shift_glyph(glyph, bpc, shift),
+                                 reference_glyph(glyph, bpc, shift))
+
+    def test_or_into(self):
+        buffer = bytearray(self.random_bytes(16))
+        data = self.random_bytes(5)
+        expected = bytearray(buffer)
+        for pos, value in enumerate(data, start=7):
+            expected[pos] |= value
+        bitpack.or_into(buffer, 7, data)
+        self.assertEqual(buffer, expected)
+
+
+@skipUnless(HAS_NUMPY, 'NumPy is not available')
+class BackendTestCase(BitpackTestCase):
+
+    def test_pages_from_rows(self):
+        for width, height in self.SIZES:
+            rows = self.rows(width, height)
+            for shift in range(8):
+                self.assertEqual(NumPyBackend.pages_from_rows(rows, shift),
+                                 PureBackend.pages_from_rows(rows, shift))
+
+    def test_shift_glyph(self):
+        for width, bpc in self.GLYPHS:
+            glyph = self.random_bytes(width*bpc)
+            for shift in range(8):
+                self.assertEqual(NumPyBackend.shift_glyph(glyph, bpc, shift),
+                                 PureBackend.shift_glyph(glyph, bpc, shift))
+
+    def test_or_bytes(self):
+        for length in (1, 7, 128):
+            first = self.random_bytes(length)
+            second = self.random_bytes(length)
+            self.assertEqual(NumPyBackend.or_bytes(first, second),
+                             PureBackend.or_bytes(first, second))
+
+
+if __name__ == '__main__':
+    main()
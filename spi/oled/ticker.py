@@ -0,0 +1,105 @@
+from bitmapfont import BitmapFont
+from oled import GfxBuffer
+from time import time as now
+
+
+class Ticker:
+    """Text banner scrolled by the SSD1306 continuous scroll engine.
+
+       The banner is rendered once into a band of display pages, then the
+       controller scrolls it with no host intervention. When the banner is
+       wider than the panel, update() should be called periodically to
+       refill the columns which have wrapped around since the last call.
+
+       As the controller forbids RAM access while scrolling, each refill
+       stops the scroll engine, writes the wrapped columns and restarts it.
+       The scroll position is estimated from the panel frame rate.
+    """
+
+    def __init__(self, display, font_name='font5x8.bin', page=0, frames=5,
+                 left=True, vertical=0, gap=32):
+        self._display = display
+        self._font_name = font_name
+        self._page = page
+        self._pages = 0
+        self._frames = frames
+        self._left = left
+        self._vertical = vertical
+        self._gap = gap
+        self._rows = []
+        self._length = 0
+        self._shift = 0
+        self._start = 0.0
+
+    def start(self, text, bold=False):
+        """Render a banner and start scrolling it"""
+        with BitmapFont(None, self._font_name) as bf:
+            height = bf.height()
+            width = bf.text_width(text, bold)
+        self._pages = BitmapFont.byte_count_for_height(height)
+        if width > self._display.WIDTH:
+            self._length = width + self._gap
+        else:
+            self._length = self._display.WIDTH
+        banner = GfxBuffer(None, self._length, 8*self._pages)
+        with BitmapFont(banner, self._font_name) as bf:
+            bf.text(text, 0, 0, bold)
+        self._rows = [bytes(banner.buffer[pos:pos+self._length])
+                      for pos in range(0, len(banner), self._length)]
+        self._shift = 0
+        self._display.stop_scroll()
+        self._write_columns(0, self._display.WIDTH)
+        self._restart()
+
+    def update(self):
+        """Refill the columns which have wrapped around, if any.
+
+           :return: the count of refilled columns
+        """
+        if self._length <= self._display.WIDTH:
+            return 0
+        steps = int((now()-self._start) * self._display.FRAME_RATE /
+                    self._frames)
+        if not steps:
+            return 0
+        self._shift = (self._shift + steps) % self._length
+        count = min(steps, self._display.WIDTH)
+        self._display.stop_scroll()
+        if self._left:
+            self._write_columns(self._display.WIDTH-count, count)
+        else:
+            self._write_columns(0, count)
+        # keep the part of a step which has already elapsed, so that the
+        # estimated position does not drift behind the controller
+        self._restart(self._start +
+                      steps * self._frames / self._display.FRAME_RATE)
+        return count
+
+    def stop(self):
+        """Stop scrolling and restore the band from the frame buffer"""
+        self._display.stop_scroll()
+        gfxbuf = self._display.gfxbuf
+        gfxbuf.invalidate((0, 8*self._page),
+                          (gfxbuf.width, 8*(self._page+self._pages)))
+        gfxbuf.paint()
+
+    @property
+    def last_page(self):
+        return self._page + self._pages - 1
+
+    def _restart(self, start=None):
+        self._display.scroll(self._page, self.last_page, self._frames,
+                             self._left, self._vertical)
+        self._start = now() if start is None else start
+
+    def _write_columns(self, column, count):
+        # a left scroll moves RAM column c+1 to c, and column 0 to the last
+        # one, a right scroll the other way around
+        if self._left:
+            first = column + self._shift
+        else:
+            first = column - self._shift
+        indices = [(first + pos) % self._length for pos in range(count)]
+        for page, row in enumerate(self._rows, start=self._page):
+            self._display.set_cursor(page, column)
+            self._display.write_buffer(bytes([row[ix] for ix in indices]))
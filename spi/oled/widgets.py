@@ -0,0 +1,272 @@
+"""Retained-mode widgets.
+
+   Each widget knows its bounding box and its last rendered state. Changing
+   a widget property only marks this widget as dirty, and Screen.render()
+   redraws the dirty widgets, then paints them at once.
+"""
+
+
+class Widget:
+    """Base widget, located by its top-left corner"""
+
+    def __init__(self, x, y):
+        self._x = x
+        self._y = y
+        self.dirty = True
+        # last rendered area, as top-left and bottom-right corners
+        self.bbox = None
+
+    @property
+    def x(self):
+        return self._x
+
+    @x.setter
+    def x(self, value):
+        self._set('x', value)
+
+    @property
+    def y(self):
+        return self._y
+
+    @y.setter
+    def y(self, value):
+        self._set('y', value)
+
+    def intersects(self, bbox):
+        if not self.bbox or not bbox:
+            return False
+        (x1, y1), (x2, y2) = self.bbox
+        (ox1, oy1), (ox2, oy2) = bbox
+        return x1 < ox2 and ox1 < x2 and y1 < oy2 and oy1 < y2
+
+    def erase(self, display):
+        """Erase the last rendered area"""
+        if self.bbox:
+            (x1, y1), (x2, y2) = self.bbox
+            display.gfxbuf.fill_rect(x1, y1, x2-x1, y2-y1)
+            self.bbox = None
+
+    def render(self, display):
+        self.erase(display)
+        self.bbox = self.draw(display)
+        self.dirty = False
+
+    def draw(self, display):
+        """Draw the widget into the frame buffer.
+
+           :return: the top-left and bottom-right corners of the drawn area
+        """
+        raise NotImplementedError()
+
+    def _set(self, name, value):
+        attr = '_%s' % name
+        if getattr(self, attr) != value:
+            setattr(self, attr, value)
+            self.dirty = True
+
+
+class Label(Widget):
+    """Single line of text"""
+
+    def __init__(self, x, y, text='', font='font5x8.bin', bold=False):
+        super().__init__(x, y)
+        self._text = text
+        self._font = font
+        self._bold = bold
+
+    @property
+    def text(self):
+        return self._text
+
+    @text.setter
+    def text(self, value):
+        self._set('text', value)
+
+    def draw(self, display):
+        bf = display.get_font(self._font)
+        bf.text(self._text, self._x, self._y, self._bold)
+        # text rendering also clears a column on each side
+        return ((max(self._x-1, 0), self._y),
+                (self._x + bf.text_width(self._text, self._bold) + 1,
+                 self._y + bf.height()))
+
+
+class ValueField(Label):
+    """Formatted value, with an optional leading caption"""
+
+    def __init__(self, x, y, value=None, fmt='%s', caption='', **kwargs):
+        super().__init__(x, y, **kwargs)
+        self._value = value
+        self._fmt = fmt
+        self._caption = caption
+
+    @property
+    def value(self):
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        self._set('value', value)
+
+    @property
+    def caption(self):
+        return self._caption
+
+    @caption.setter
+    def caption(self, value):
+        self._set('caption', value)
+
+    @property
+    def fmt(self):
+        return self._fmt
+
+    @fmt.setter
+    def fmt(self, value):
+        self._set('fmt', value)
+
+    @property
+    def text(self):
+        if self._value is None:
+            return self._caption
+        return self._caption + self._fmt % self._value
+
+    @text.setter
+    def text(self, value):
+        raise AttributeError('ValueField text is built from its caption, '
+                             'format and value, set those instead')
+
+    def draw(self, display):
+        self._text = self.text
+        return super().draw(display)
+
+
+class Bar(Widget):
+    """Horizontal progress bar, with an outline"""
+
+    def __init__(self, x, y, width, height, value=0, minimum=0, maximum=100):
+        super().__init__(x, y)
+        self._width = width
+        self._height = height
+        self._value = value
+        self._minimum = minimum
+        self._maximum = maximum
+
+    @property
+    def value(self):
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        self._set('value', max(self._minimum, min(value, self._maximum)))
+
+    def draw(self, display):
+        gfxbuf = display.gfxbuf
+        x, y, width, height = self._x, self._y, self._width, self._height
+        gfxbuf.fill_rect(x, y, width, height, True)
+        gfxbuf.fill_rect(x+1, y+1, width-2, height-2)
+        span = self._maximum - self._minimum
+        if span > 0:
+            fill = (width-4) * (self._value - self._minimum) // span
+            gfxbuf.fill_rect(x+2, y+2, fill, height-4, True)
+        return (x, y), (x+width, y+height)
+
+
+class Icon(Widget):
+    """Pre-compiled sprite, see sprites.py"""
+
+    def __init__(self, x, y, sprite=None):
+        super().__init__(x, y)
+        self._sprite = sprite
+
+    @property
+    def sprite(self):
+        return self._sprite
+
+    @sprite.setter
+    def sprite(self, value):
+        self._set('sprite', value)
+
+    def draw(self, display):
+        if not self._sprite:
+            return None
+        display.gfxbuf.draw_sprite(self._sprite, self._x, self._y)
+        return ((self._x, self._y),
+                (self._x + self._sprite.width, self._y + self._sprite.height))
+
+
+class QRCode(Widget):
+    """QR code, each module being scale x scale pixels"""
+
+    def __init__(self, x, y, message='', scale=2):
+        super().__init__(x, y)
+        self._message = message
+        self._scale = scale
+
+    @property
+    def message(self):
+        return self._message
+
+    @message.setter
+    def message(self, value):
+        self._set('message', value)
+
+    def draw(self, display):
+        if not self._message:
+            return None
+        tl, br = display.draw_qrcode(self._message, self._x, self._y,
+                                     self._scale)
+        return tl and (tl, br) or None
+
+
+class Screen:
+    """Widget tree root"""
+
+    def __init__(self, display):
+        self._display = display
+        self._widgets = []
+        self._erased = []
+
+    def add(self, widget):
+        self._widgets.append(widget)
+        widget.dirty = True
+        return widget
+
+    def remove(self, widget):
+        self._widgets.remove(widget)
+        if widget.bbox:
+            self._erased.append(widget.bbox)
+            widget.erase(self._display)
+
+    def render(self):
+        """Redraw the dirty widgets and paint them in a single update.
+
+           :return: the count of redrawn widgets
+        """
+        redraw = [widget for widget in self._widgets if widget.dirty]
+        damaged = self._erased
+        self._erased = []
+        if not redraw and not damaged:
+            return 0
+        drawn = False
+        while True:
+            # erasing or drawing a widget, at either its previous or its new
+            # location, may damage the widgets it overlaps, which in turn
+            # need to be redrawn
+            damaged.extend(widget.bbox for widget in redraw if widget.bbox)
+            more = [widget for widget in self._widgets
+                    if widget not in redraw and
+                    any(widget.intersects(bbox) for bbox in damaged)]
+            if more:
+                redraw.extend(more)
+                drawn = False
+                continue
+            if drawn:
+                break
+            for widget in redraw:
+                widget.erase(self._display)
+            for widget in self._widgets:
+                if widget in redraw:
+                    widget.render(self._display)
+            drawn = True
+        self._display.gfxbuf.paint()
+        return len(redraw)